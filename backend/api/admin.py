@@ -7,7 +7,8 @@ from .models import (CustomUser, Tag, Ingredient, RecipeIngredient,
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'email', 'username')
+    list_display = ('id', 'email', 'username', 'recipes_count',
+                    'subscribers_count')
     search_fields = ('username', 'email')
     list_filter = ('username', 'email')
     empty_value_display = '-пусто-'
@@ -28,13 +29,14 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author')
+    list_display = ('id', 'name', 'author', 'favorite_count')
     search_fields = ('name', 'author', 'tags__slug')
     list_filter = ('name', 'author', 'tags__slug')
     empty_value_display = '-пусто-'
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorite_count(self, obj):
-        return obj.recipefavorite.count()
+        return obj.favorites_count
 
 
 @admin.register(RecipeIngredient)
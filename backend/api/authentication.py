@@ -0,0 +1,49 @@
+from rest_framework import authentication as auth
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import authentication as jwt_auth
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import get_user_snapshot, set_user_snapshot
+
+
+class CachingJWTAuthentication(jwt_auth.JWTAuthentication):
+    """
+    JWTAuthentication, которая несколько секунд помнит пользователя по паре
+    (user_id, jti) токена и не обращается к таблице пользователей на
+    каждый запрос. Снимки сбрасываются при сохранении пользователя, выходе
+    и занесении токена в чёрный список; в остальных процессах они живут
+    не дольше AUTH_USER_CACHE_TTL.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None or jti is None:
+            return super().get_user(validated_token)
+        user = get_user_snapshot(user_id, jti)
+        if user is None:
+            user = super().get_user(validated_token)
+            set_user_snapshot(user_id, jti, user)
+        return user
+
+
+class JWTOrSessionAuthentication(CachingJWTAuthentication):
+    """
+    JWT, а без заголовка Authorization — сессия Django, за один проход.
+
+    На безопасных запросах негодный токен не считается ошибкой: запрос
+    продолжается анонимно (или по сессии), а доступ решают права
+    представления. На изменяющих запросах ошибка токена возвращается
+    клиенту как 401.
+    """
+
+    def authenticate(self, request):
+        if self.get_header(request) is not None:
+            try:
+                return super().authenticate(request)
+            except (InvalidToken, AuthenticationFailed):
+                if request.method not in permissions.SAFE_METHODS:
+                    raise
+        return auth.SessionAuthentication().authenticate(request)
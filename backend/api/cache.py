@@ -0,0 +1,248 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Ingredient, Tag
+
+SHOPPING_LIST_PDF_KEY = 'shopping_list:pdf:{}'
+SHOPPING_LIST_USER_KEY = 'shopping_list:user:{}'
+CATALOGUE_VERSION_KEY = 'catalogue:version:{}'
+RECIPE_COUNT_KEY = 'recipe_count:{}:{}'
+RECIPE_COUNT_VERSION_KEY = 'recipe_count:version:{}'
+
+TagRow = namedtuple('TagRow', ('id', 'name', 'color', 'slug'))
+IngredientRow = namedtuple(
+    'IngredientRow', ('id', 'name', 'measurement_unit')
+)
+CATALOGUE_ROWS = {
+    Tag: TagRow,
+    Ingredient: IngredientRow,
+}
+
+_catalogues = {}
+_stamps = {}
+_user_snapshots = OrderedDict()
+_user_snapshots_lock = threading.Lock()
+
+
+def shopping_list_cache():
+    return caches[settings.SHOPPING_LIST_CACHE]
+
+
+def shopping_list_digest(username, items):
+    digest = hashlib.sha256(username.encode('utf-8'))
+    for item in items:
+        digest.update('{}\x1f{}\x1f{}\x1e'.format(
+            item['name'], item['measurement_unit'], item['total_amount']
+        ).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_shopping_list_pdf(digest):
+    return shopping_list_cache().get(SHOPPING_LIST_PDF_KEY.format(digest))
+
+
+def set_shopping_list_pdf(user_id, digest, content):
+    if len(content) > settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+        return
+    cache = shopping_list_cache()
+    cache.set_many({
+        SHOPPING_LIST_PDF_KEY.format(digest): content,
+        SHOPPING_LIST_USER_KEY.format(user_id): digest,
+    })
+
+
+def forget_shopping_lists(user_ids):
+    cache = shopping_list_cache()
+    user_keys = [SHOPPING_LIST_USER_KEY.format(pk) for pk in set(user_ids)]
+    if not user_keys:
+        return
+    digests = cache.get_many(user_keys)
+    cache.delete_many(
+        user_keys +
+        [SHOPPING_LIST_PDF_KEY.format(digest) for digest in digests.values()]
+    )
+
+
+class Catalogue:
+    """
+    Снимок таблицы. version — хеш строк снимка, поэтому совпадает у всех
+    процессов с одинаковыми данными и меняется вместе с ними; modified —
+    время, когда процесс впервые увидел эти данные.
+    """
+
+    def __init__(self, stamp, rows, previous=None):
+        self.stamp = stamp
+        self.rows = MappingProxyType({row.id: row for row in rows})
+        digest = hashlib.sha256()
+        for row in self.rows.values():
+            digest.update(repr(tuple(row)).encode('utf-8'))
+        self.version = digest.hexdigest()
+        if previous is not None and previous.version == self.version:
+            self.modified = previous.modified
+        else:
+            self.modified = int(time.time())
+
+    def get(self, pk):
+        return self.rows.get(pk)
+
+    def values(self):
+        return [row._asdict() for row in self.rows.values()]
+
+
+def new_stamp():
+    return '{:.6f}'.format(time.time())
+
+
+def get_stamps(keys):
+    """
+    Версии из общего для процессов кэша STAMP_CACHE. Процесс перечитывает
+    их не чаще раза в STAMP_CHECK_INTERVAL секунд, а свои изменения видит
+    сразу. Истёкшая версия создаётся заново, что лишь сбрасывает кэши,
+    построенные на прежней.
+    """
+    now = time.monotonic()
+    stamps = {}
+    missing = []
+    for key in keys:
+        stamp = _stamps.get(key)
+        if stamp is not None and \
+                now - stamp[1] < settings.STAMP_CHECK_INTERVAL:
+            stamps[key] = stamp[0]
+        else:
+            missing.append(key)
+    if missing:
+        cache = caches[settings.STAMP_CACHE]
+        found = cache.get_many(missing)
+        for key in missing:
+            if key not in found:
+                cache.add(key, new_stamp(), settings.STAMP_TTL)
+                found[key] = cache.get(key) or new_stamp()
+            stamps[key] = found[key]
+            _stamps[key] = (found[key], now)
+    return stamps
+
+
+def bump_stamp(key):
+    stamp = new_stamp()
+    caches[settings.STAMP_CACHE].set(key, stamp, settings.STAMP_TTL)
+    _stamps[key] = (stamp, time.monotonic())
+
+
+def catalogue_version_key(model):
+    return CATALOGUE_VERSION_KEY.format(model._meta.label_lower)
+
+
+def get_catalogue(model):
+    """
+    Снимок перечитывается только при смене версии: её меняют сигналы и
+    команды массовой загрузки, а истечение STAMP_TTL — не реже раза в сутки.
+    """
+    key = catalogue_version_key(model)
+    stamp = get_stamps([key])[key]
+    catalogue = _catalogues.get(model)
+    if catalogue is None or catalogue.stamp != stamp:
+        row_class = CATALOGUE_ROWS[model]
+        catalogue = Catalogue(stamp, map(
+            row_class._make,
+            model.objects.order_by('id').values_list(*row_class._fields)
+        ), catalogue)
+        _catalogues[model] = catalogue
+    return catalogue
+
+
+def tag_catalogue():
+    return get_catalogue(Tag)
+
+
+def ingredient_catalogue():
+    return get_catalogue(Ingredient)
+
+
+def bump_catalogue(model):
+    bump_stamp(catalogue_version_key(model))
+
+
+def recipe_count_cache():
+    return caches[settings.RECIPE_COUNT_CACHE]
+
+
+def recipe_count_version(user_id=None):
+    """
+    Версия списков рецептов и их счётчиков: общая и, если задан user_id,
+    пользователя.
+    """
+    keys = [RECIPE_COUNT_VERSION_KEY.format('all')]
+    if user_id is not None:
+        keys.append(RECIPE_COUNT_VERSION_KEY.format(user_id))
+    versions = get_stamps(keys)
+    return ':'.join(versions[key] for key in keys)
+
+
+def recipe_count_key(params, user_id=None):
+    digest = hashlib.md5(repr((user_id, params)).encode('utf-8'))
+    return RECIPE_COUNT_KEY.format(
+        recipe_count_version(user_id), digest.hexdigest()
+    )
+
+
+def get_recipe_count(key):
+    return recipe_count_cache().get(key)
+
+
+def set_recipe_count(key, count):
+    recipe_count_cache().set(key, count, settings.RECIPE_COUNT_TTL)
+
+
+def forget_recipe_counts(user_id=None):
+    bump_stamp(RECIPE_COUNT_VERSION_KEY.format(
+        'all' if user_id is None else user_id
+    ))
+
+
+def get_user_snapshot(user_id, jti):
+    """
+    Копия пользователя, загруженного этим процессом по тому же токену
+    не раньше AUTH_USER_CACHE_TTL секунд назад.
+    """
+    key = (user_id, jti)
+    with _user_snapshots_lock:
+        snapshot = _user_snapshots.get(key)
+        if snapshot is None:
+            return None
+        user, loaded = snapshot
+        if time.monotonic() - loaded > settings.AUTH_USER_CACHE_TTL:
+            del _user_snapshots[key]
+            return None
+        _user_snapshots.move_to_end(key)
+    return copy.copy(user)
+
+
+def set_user_snapshot(user_id, jti, user):
+    with _user_snapshots_lock:
+        _user_snapshots[(user_id, jti)] = (copy.copy(user), time.monotonic())
+        _user_snapshots.move_to_end((user_id, jti))
+        while len(_user_snapshots) > settings.AUTH_USER_CACHE_SIZE:
+            _user_snapshots.popitem(last=False)
+
+
+def forget_user_snapshots(user_id):
+    user_id = str(user_id)
+    with _user_snapshots_lock:
+        for key in [key for key in _user_snapshots
+                    if str(key[0]) == user_id]:
+            del _user_snapshots[key]
+
+
+def forget_process_caches():
+    """Сбрасывает снимки каталогов, версий и пользователей этого процесса."""
+    _catalogues.clear()
+    _stamps.clear()
+    with _user_snapshots_lock:
+        _user_snapshots.clear()
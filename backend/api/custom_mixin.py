@@ -1,6 +1,17 @@
+import hashlib
+
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import viewsets, mixins, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
+from .utils import delete_rows, insert_ignore
+
 
 class CustomMixin(viewsets.GenericViewSet,
                   mixins.ListModelMixin,
@@ -9,20 +20,114 @@ class CustomMixin(viewsets.GenericViewSet,
     pass
 
 
-class CustomCreateDestroyViewSet(viewsets.ModelViewSet):
+class CustomCreateDestroyViewSet(viewsets.GenericViewSet):
+    """
+    Добавление и удаление связи пользователя с объектом (рецептом или
+    автором) одним INSERT ... ON CONFLICT DO NOTHING или DELETE по
+    уникальному ограничению модели. Сигналы post_save/post_delete
+    отправляются вручную, чтобы счётчики и кэши оставались согласованными.
+    """
+    target_model = None
+    target_field = None
+    target_url_kwarg = None
+    # Поля объекта, нужные get_link_values и response_serializer_class.
+    target_fields = ('id',)
+    response_serializer_class = None
+    already_exists_message = 'Запись уже существует'
+
+    def get_target_id(self):
+        target_id = self.kwargs.get(self.target_url_kwarg)
+        if not str(target_id).isdigit():
+            raise Http404
+        return int(target_id)
+
+    def get_target(self):
+        # Блокировка не даёт удалить объект до вставки связи, поэтому
+        # нарушения внешнего ключа быть не может. Её всё равно берёт
+        # обновление счётчика объекта в той же транзакции.
+        return get_object_or_404(
+            self.target_model.objects.select_for_update(
+                no_key=True
+            ).only(*self.target_fields),
+            pk=self.get_target_id()
+        )
 
-    def create(self, request, data=None, response_serializer=None,
-               response_data=None, *args, **kwargs):
-        serializer = self.get_serializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(response_serializer(
-            serializer.validated_data.get(response_data),
-            context={'request': request}).data, status=status.HTTP_200_OK)
+    def get_link_values(self, target):
+        return {'user': self.request.user.id, self.target_field: target.pk}
 
-    def destroy(self, request, data=None, obj=None,
-                response_data=None, *args, **kwargs):
-        serializer = self.get_serializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        obj.delete()
+    def get_link(self, values):
+        model = self.get_queryset().model
+        return model(**{
+            model._meta.get_field(name).attname: value
+            for name, value in values.items()
+        })
+
+    @transaction.atomic
+    def create(self, request, *args, **kwargs):
+        target = self.get_target()
+        values = self.get_link_values(target)
+        model = self.get_queryset().model
+        if not insert_ignore(model, **values):
+            raise ValidationError(
+                {'non_field_errors': [self.already_exists_message]}
+            )
+        post_save.send(
+            sender=model, instance=self.get_link(values), created=True,
+            update_fields=None, raw=False, using=router.db_for_write(model)
+        )
+        return Response(self.response_serializer_class(
+            target, context=self.get_serializer_context()
+        ).data, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        target_id = self.get_target_id()
+        model = self.get_queryset().model
+        values = {'user': request.user.id, self.target_field: target_id}
+        if not delete_rows(model, **values):
+            if not self.target_model.objects.filter(pk=target_id).exists():
+                raise Http404
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        post_delete.send(
+            sender=model, instance=self.get_link(values),
+            using=router.db_for_write(model)
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ConditionalGetMixin:
+    vary_headers = ()
+
+    def get_etag(self, request):
+        return None
+
+    def get_last_modified(self, request):
+        return None
+
+    def conditional_get(self, request, view_method, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag is not None:
+            etag = quote_etag(hashlib.md5(etag.encode('utf-8')).hexdigest())
+        last_modified = self.get_last_modified(request)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view_method(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            if etag is not None:
+                response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        if self.vary_headers:
+            patch_vary_headers(response, self.vary_headers)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(
+            request, super().retrieve, *args, **kwargs
+        )
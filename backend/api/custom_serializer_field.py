@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from .images import clean_image, rendition_urls
 from .utils import Converter
 
 
@@ -7,4 +8,28 @@ class Base64ImageField(serializers.ImageField, Converter):
 
     def to_internal_value(self, data):
         if 'data:' in data and ';base64,' in data:
-            return super().to_internal_value(self.get_file_from_base64(data))
+            with self.get_file_from_base64(data) as file:
+                cleaned = clean_image(file)
+            # clean_image уже открыл изображение Pillow; проверка
+            # ImageField прочитала бы файл в память ещё раз целиком.
+            return serializers.FileField.to_internal_value(self, cleaned)
+
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Ссылки на превью изображения рецепта, когда они построены."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image or not recipe.image_renditions:
+            return None
+        request = self.context.get('request')
+        urls = rendition_urls(recipe.image)
+        if request is None:
+            return urls
+        return {
+            rendition: request.build_absolute_uri(url)
+            for rendition, url in urls.items()
+        }
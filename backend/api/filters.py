@@ -1,11 +1,22 @@
 import django_filters
+from django.conf import settings
+from django.db import connection
+from django.db.models import (Case, Exists, IntegerField, OuterRef, Q, Value,
+                              When)
 from django_filters import rest_framework as filters
 
-from .models import Recipe, Ingredient
+from .cache import tag_catalogue
+from .models import Recipe, RecipeTag, Ingredient
+
+
+def tag_slug_choices():
+    return [(tag.slug, tag.slug) for tag in tag_catalogue().rows.values()]
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_slug_choices, method='filter_tags'
+    )
     author = filters.Filter(field_name='author__id')
     is_favorited = django_filters.NumberFilter(
         method='filter_is_favorited',
@@ -14,6 +25,14 @@ class RecipeFilter(filters.FilterSet):
         method='filter_is_in_shopping_cart',
     )
 
+    def filter_tags(self, queryset, name, value):
+        slugs = set(value)
+        tag_ids = [tag.id for tag in tag_catalogue().rows.values()
+                   if tag.slug in slugs]
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids
+        )))
+
     def filter_is_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(recipe_favorite__user=self.request.user)
@@ -30,7 +49,39 @@ class RecipeFilter(filters.FilterSet):
 
 
 class IngredientFilterSet(filters.FilterSet):
-    name = filters.Filter(field_name='name', lookup_expr='contains')
+    name = filters.CharFilter(method='filter_name')
+
+    def filter_name(self, queryset, name, value):
+        """
+        Сначала совпадения по началу названия (условие по индексу
+        search_name и LIMIT), затем, если их не хватило до
+        INGREDIENT_SEARCH_LIMIT, совпадения внутри названия.
+        """
+        value = value.strip().lower()
+        if not value:
+            return queryset
+        if connection.vendor == 'postgresql':
+            prefix = Q(search_name__startswith=value)
+        else:
+            prefix = Q(search_name__gte=value,
+                       search_name__lt=value + '\U0010ffff')
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        ids = list(queryset.filter(prefix).order_by(
+            'search_name'
+        ).values_list('id', flat=True)[:limit])
+        if len(ids) < limit:
+            ids += queryset.filter(search_name__contains=value).exclude(
+                prefix
+            ).order_by('search_name').values_list(
+                'id', flat=True
+            )[:limit - len(ids)]
+        if not ids:
+            return queryset.none()
+        return queryset.filter(id__in=ids).order_by(Case(
+            *[When(id=pk, then=Value(position))
+              for position, pk in enumerate(ids)],
+            output_field=IntegerField()
+        ))
 
     class Meta:
         model = Ingredient
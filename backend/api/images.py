@@ -0,0 +1,150 @@
+import hashlib
+import os
+from functools import partial
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+from .cache import forget_recipe_counts
+from .models import Recipe
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {},
+    'WEBP': {'quality': 90},
+    'GIF': {},
+}
+# name: (format, size, crop)
+RENDITIONS = {
+    'thumbnail': ('JPEG', settings.RECIPE_IMAGE_THUMBNAIL_SIZE, True),
+    'thumbnail_webp': ('WEBP', settings.RECIPE_IMAGE_THUMBNAIL_SIZE, True),
+    'webp': ('WEBP', settings.RECIPE_IMAGE_WEBP_SIZE, False),
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+CHUNK_SIZE = 64 * 1024
+
+
+def open_image(file):
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise ValidationError('Загрузите корректное изображение')
+    width, height = image.size
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        image.close()
+        raise ValidationError(
+            'Изображение больше {} пикселей'.format(
+                settings.RECIPE_IMAGE_MAX_PIXELS
+            )
+        )
+    if image.format not in SAVE_OPTIONS:
+        image.close()
+        raise ValidationError('Формат изображения не поддерживается')
+    return image
+
+
+def strip_metadata(image):
+    """
+    Копия изображения из одних пикселей (и палитры с прозрачностью):
+    EXIF, ICC-профиль, текстовые блоки и прочие поля info не переносятся.
+    """
+    cleaned = Image.new(image.mode, image.size)
+    if image.mode in ('P', 'PA'):
+        cleaned.putpalette(image.getpalette())
+    if 'transparency' in image.info:
+        cleaned.info['transparency'] = image.info['transparency']
+    cleaned.paste(image)
+    return cleaned
+
+
+def clean_image(file):
+    """
+    Пересохраняет изображение без метаданных (EXIF, ICC, текстовых блоков),
+    повернув его по EXIF-ориентации. Имя файла — SHA-256 содержимого.
+    """
+    with open_image(file) as image:
+        image_format = image.format
+        cleaned = strip_metadata(ImageOps.exif_transpose(image))
+    output = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    cleaned.save(output, image_format, **SAVE_OPTIONS[image_format])
+    output.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(partial(output.read, CHUNK_SIZE), b''):
+        digest.update(chunk)
+    output.seek(0)
+    return File(output, name='{}.{}'.format(
+        digest.hexdigest(), EXTENSIONS[image_format]
+    ))
+
+
+def rendition_name(name, rendition):
+    image_format = RENDITIONS[rendition][0]
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return 'renditions/{}.{}.{}'.format(
+        stem, rendition, EXTENSIONS[image_format]
+    )
+
+
+def rendition_urls(image):
+    return {
+        rendition: image.storage.url(rendition_name(image.name, rendition))
+        for rendition in RENDITIONS
+    }
+
+
+def render_rendition(image, image_format, size, crop):
+    alpha = 'A' in image.getbands() or 'transparency' in image.info
+    mode = 'RGBA' if alpha and image_format != 'JPEG' else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(size, Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, image_format, **SAVE_OPTIONS[image_format])
+    return output.getvalue()
+
+
+def build_image_renditions(recipe_id, force=False):
+    """
+    Строит превью изображения рецепта и отмечает рецепт, если за это
+    время изображение не было заменено. Уже построенные для того же
+    файла превью переиспользуются, если не задан force.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return False
+    name = recipe.image.name
+    storage = recipe.image.storage
+    missing = {
+        rendition: rendition_name(name, rendition)
+        for rendition in RENDITIONS
+    }
+    if not force:
+        missing = {
+            rendition: path for rendition, path in missing.items()
+            if not storage.exists(path)
+        }
+    if missing:
+        with recipe.image.open('rb'), Image.open(recipe.image) as image:
+            image.load()
+            for rendition, path in missing.items():
+                content = render_rendition(image, *RENDITIONS[rendition])
+                storage.delete(path)
+                storage.save(path, ContentFile(content))
+    built = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_renditions=True, updated_at=timezone.now()
+    ) > 0
+    if built:
+        forget_recipe_counts()
+    return built
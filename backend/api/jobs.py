@@ -0,0 +1,217 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from rest_framework import status
+
+from .cache import shopping_list_digest, get_shopping_list_pdf
+from .exception import CustomApiException
+from .images import build_image_renditions
+from .utils import aggregate_shopping_cart, render_to_pdf
+from .workers import start_worker
+
+JOB_KEY = 'shopping_list:job:{}'
+JOB_PENDING = 'pending'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+_executor = None
+_image_executor = None
+_pending = {}
+_worker_pids = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    # Как и пул превью, процессы запускаются через spawn, а не fork: форк
+    # многопоточного воркера наследует соединения с базой и блокировки.
+    global _executor
+    if _executor is None:
+        context = multiprocessing.get_context('spawn')
+        pids = context.SimpleQueue()
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.PDF_RENDER_WORKERS,
+            mp_context=context,
+            initializer=start_worker,
+            initargs=(pids,)
+        )
+        _worker_pids[_executor] = pids
+    return _executor
+
+
+def get_image_executor():
+    # Воркеры ходят в базу, поэтому запускаются начисто, а не через fork
+    # с унаследованными соединениями.
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        )
+    return _image_executor
+
+
+def enqueue_image_renditions(recipe_id):
+    # Сбой пула не должен ломать сохранение рецепта: недостроенные превью
+    # достраивает команда build_image_renditions.
+    global _image_executor
+    try:
+        return get_image_executor().submit(build_image_renditions, recipe_id)
+    except (RuntimeError, OSError):
+        _image_executor = None
+        return None
+
+
+def render_shopping_list_job(username, shopping_list):
+    pdf = render_to_pdf('shopping_list.html', {
+        'user_username': username,
+        'shopping_list': shopping_list,
+    })
+    if pdf is None:
+        raise ValueError('shopping list rendering failed')
+    return pdf.content
+
+
+def job_cache():
+    return caches[settings.PDF_RENDER_JOB_CACHE]
+
+
+def load_job(job_id):
+    return job_cache().get(JOB_KEY.format(job_id))
+
+
+def save_job(job_id, job):
+    job_cache().set(
+        JOB_KEY.format(job_id), job, settings.PDF_RENDER_RESULT_TTL
+    )
+
+
+def fail_job(job_id, job):
+    job = {'user': job['user'], 'status': JOB_FAILED,
+           'created': job['created']}
+    save_job(job_id, job)
+    return job
+
+
+def recycle_executor(executor):
+    # Запущенную задачу ProcessPoolExecutor не отменить, поэтому процессы
+    # пула останавливаются, а следующая задача получит новый пул.
+    # Остальные задачи старого пула завершатся с ошибкой. Процессы пула
+    # находятся по PID, которые они сообщили при запуске.
+    global _executor
+    if _executor is executor:
+        _executor = None
+    pids = set()
+    queue = _worker_pids.pop(executor, None)
+    while queue is not None and not queue.empty():
+        pids.add(queue.get())
+    for process in multiprocessing.active_children():
+        if process.pid in pids:
+            process.terminate()
+    executor.shutdown(wait=False)
+
+
+def running_jobs():
+    """
+    Задачи, запущенные этим процессом. Лимит PDF_RENDER_QUEUE_SIZE
+    действует в каждом воркере сервера отдельно.
+    """
+    return sum(not future.done() for future, timer in _pending.values())
+
+
+def expire_job(job_id, created, future, executor):
+    try:
+        with _lock:
+            entry = _pending.get(job_id)
+            if entry is None or entry[0] is not future or future.done():
+                return
+            if not future.cancel():
+                recycle_executor(executor)
+        job = load_job(job_id)
+        if job is not None and job['status'] == JOB_PENDING and \
+                job['created'] == created:
+            fail_job(job_id, job)
+    finally:
+        connections.close_all()
+
+
+def finish_job(job_id, created, caller, future):
+    try:
+        with _lock:
+            entry = _pending.get(job_id)
+            if entry is not None and entry[0] is future:
+                del _pending[job_id]
+                entry[1].cancel()
+        job = load_job(job_id)
+        # Просроченная или перезапущенная задача не перезаписывается
+        # результатом прежнего запуска.
+        if job is None or job['status'] != JOB_PENDING or \
+                job['created'] != created:
+            return
+        if future.cancelled() or future.exception() is not None:
+            fail_job(job_id, job)
+        else:
+            save_job(job_id, dict(
+                job, status=JOB_DONE, content=future.result()
+            ))
+    finally:
+        # Колбэк выполняется в служебном потоке пула, если только задача
+        # не успела завершиться до его регистрации.
+        if threading.get_ident() != caller:
+            connections.close_all()
+
+
+def enqueue_shopping_list(user):
+    shopping_list = list(aggregate_shopping_cart(user))
+    job_id = shopping_list_digest(user.username, shopping_list)
+    job = get_job(user, job_id)
+    if job is not None and job['status'] != JOB_FAILED:
+        return job_id, job
+    content = get_shopping_list_pdf(job_id)
+    if content is not None:
+        job = {'user': user.id, 'status': JOB_DONE, 'content': content,
+               'created': time.time()}
+        save_job(job_id, job)
+        return job_id, job
+    with _lock:
+        if running_jobs() >= settings.PDF_RENDER_QUEUE_SIZE:
+            raise CustomApiException(
+                detail={'detail': 'Очередь формирования списков заполнена'},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        job = {'user': user.id, 'status': JOB_PENDING,
+               'created': time.time()}
+        save_job(job_id, job)
+        executor = get_executor()
+        future = executor.submit(
+            render_shopping_list_job, user.username, shopping_list
+        )
+        timer = threading.Timer(settings.PDF_RENDER_TIMEOUT, expire_job, (
+            job_id, job['created'], future, executor
+        ))
+        timer.daemon = True
+        _pending[job_id] = (future, timer)
+    timer.start()
+    future.add_done_callback(partial(
+        finish_job, job_id, job['created'], threading.get_ident()
+    ))
+    return job_id, job
+
+
+def get_job(user, job_id):
+    job = load_job(job_id)
+    if job is None or job['user'] != user.id:
+        return None
+    # Задачи этого процесса останавливает таймер, а задачу процесса,
+    # который не дожил до её завершения, — первый опрос после таймаута.
+    expired = time.time() - job['created'] > settings.PDF_RENDER_TIMEOUT
+    if job['status'] == JOB_PENDING and expired and job_id not in _pending:
+        job = fail_job(job_id, job)
+    return job
@@ -0,0 +1,253 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.cache import forget_process_caches
+from api.models import CustomUser, Tag, Ingredient, Recipe, Subscribe
+
+# Лишний запрос на строку выводит такую страницу далеко за бюджет.
+PAGE_SIZE = 50
+
+# Худший случай на странице из PAGE_SIZE записей: пользователь
+# перечитан после AUTH_USER_CACHE_TTL, счётчик — после RECIPE_COUNT_TTL.
+# *_cold — без прогрева кэшей PDF, каталогов и версий.
+DEFAULT_BUDGETS = {
+    'recipes': 5,
+    'recipes_tags': 5,
+    'recipes_author': 5,
+    'recipes_favorited': 5,
+    'recipes_in_cart': 5,
+    'recipe_detail': 4,
+    'subscriptions': 4,
+    'subscriptions_empty': 2,
+    'users': 3,
+    'ingredients_search': 4,
+    'tags': 1,
+    'favorite_add': 6,
+    'favorite_remove': 5,
+    'cart_add': 5,
+    'cart_remove': 4,
+    'subscribe_add': 8,
+    'subscribe_remove': 5,
+    'cart_download_csv': 2,
+    'cart_download_pdf': 2,
+    'cart_download_pdf_cold': 2,
+    'recipes_cold': 7,
+    'tags_cold': 2,
+}
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число запросов к БД и время ответа эндпоинтов API '
+            'на заполненной базе (см. seed_foodgram)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--budgets', help='JSON-файл с бюджетами вида '
+                            '{"recipes": {"queries": 8, "p95_ms": 150}}')
+        parser.add_argument('--host', default='127.0.0.1')
+
+    def handle(self, *args, **options):
+        budgets = self.load_budgets(options['budgets'])
+        user = self.pick_user()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError('База пуста, сначала выполните seed_foodgram')
+        client = self.make_client(user, options['host'])
+        runs = [(client, self.endpoints(user), False),
+                (client, self.cold_endpoints(), True)]
+        lonely = CustomUser.objects.exclude(id=user.id).filter(
+            subscribed__isnull=True
+        ).first()
+        if lonely is not None:
+            runs.append((self.make_client(lonely, options['host']),
+                         self.lonely_endpoints(), False))
+        results = []
+        with transaction.atomic():
+            for run_client, endpoints, cold in runs:
+                for name, method, url in endpoints:
+                    results.append(self.measure(
+                        run_client, name, method, url,
+                        options['iterations'], cold
+                    ))
+            transaction.set_rollback(True)
+        failures = self.report(results, budgets)
+        if failures:
+            raise CommandError(
+                'Превышен бюджет: {}'.format(', '.join(failures))
+            )
+
+    def make_client(self, user, host):
+        client = APIClient(HTTP_HOST=host)
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            RefreshToken.for_user(user).access_token
+        ))
+        return client
+
+    def load_budgets(self, path):
+        budgets = {name: {'queries': queries}
+                   for name, queries in DEFAULT_BUDGETS.items()}
+        if path:
+            with open(path, encoding='utf-8') as budget_file:
+                for name, budget in json.load(budget_file).items():
+                    budgets.setdefault(name, {}).update(budget)
+        return budgets
+
+    def pick_user(self):
+        subscriber = Subscribe.objects.values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        if subscriber is None:
+            return CustomUser.objects.first()
+        return CustomUser.objects.get(id=subscriber['user'])
+
+    def endpoints(self, user):
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        recipe = Recipe.objects.first()
+        foreign = Recipe.objects.exclude(author=user).exclude(
+            recipe_favorite__user=user
+        ).exclude(shopped__user=user).first() or recipe
+        author = CustomUser.objects.exclude(id=user.id).exclude(
+            subscribe__user=user
+        ).first()
+        endpoints = [
+            ('recipes', 'get', '/api/recipes/?limit={}'.format(PAGE_SIZE)),
+            ('recipes_author', 'get',
+             '/api/recipes/?author={}&limit={}'.format(
+                 recipe.author_id, PAGE_SIZE
+             )),
+            ('recipes_favorited', 'get',
+             '/api/recipes/?is_favorited=1&limit={}'.format(PAGE_SIZE)),
+            ('recipes_in_cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1&limit={}'.format(
+                 PAGE_SIZE
+             )),
+            ('recipe_detail', 'get', '/api/recipes/{}/'.format(recipe.id)),
+            ('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3&limit={}'.format(
+                 PAGE_SIZE
+             )),
+            ('users', 'get', '/api/users/?limit={}'.format(PAGE_SIZE)),
+            ('tags', 'get', '/api/tags/'),
+            ('cart_download_csv', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv'),
+            ('cart_download_pdf', 'get',
+             '/api/recipes/download_shopping_cart/'),
+        ]
+        if tag is not None:
+            endpoints.append(('recipes_tags', 'get',
+                              '/api/recipes/?tags={}&limit={}'.format(
+                                  tag.slug, PAGE_SIZE)))
+        if ingredient is not None:
+            endpoints.append(('ingredients_search', 'get',
+                              '/api/ingredients/?name={}'.format(
+                                  ingredient.name[:3])))
+        for name, url in (
+                ('favorite', '/api/recipes/{}/favorite/'.format(foreign.id)),
+                ('cart', '/api/recipes/{}/shopping_cart/'.format(foreign.id))):
+            endpoints.append((name + '_add', 'post', url))
+            endpoints.append((name + '_remove', 'delete', url))
+        if author is not None:
+            url = '/api/users/{}/subscribe/'.format(author.id)
+            endpoints.append(('subscribe_add', 'post', url))
+            endpoints.append(('subscribe_remove', 'delete', url))
+        return endpoints
+
+    def cold_endpoints(self):
+        # Те же запросы без прогрева: PDF рендерится заново, каталоги
+        # и версии перечитываются.
+        return [
+            ('cart_download_pdf_cold', 'get',
+             '/api/recipes/download_shopping_cart/'),
+            ('recipes_cold', 'get', '/api/recipes/?limit={}'.format(
+                PAGE_SIZE
+            )),
+            ('tags_cold', 'get', '/api/tags/'),
+        ]
+
+    def lonely_endpoints(self):
+        # Пользователь без подписок: пустые страницы не должны падать
+        # или обходиться дороже заполненных.
+        return [
+            ('subscriptions_empty', 'get',
+             '/api/users/subscriptions/?recipes_limit=3&limit={}'.format(
+                 PAGE_SIZE
+             )),
+        ]
+
+    def forget_caches(self):
+        forget_process_caches()
+        caches[settings.SHOPPING_LIST_CACHE].clear()
+        caches[settings.RECIPE_COUNT_CACHE].clear()
+
+    def measure(self, client, name, method, url, iterations, cold=False):
+        timings = []
+        queries = sql_time = 0
+        status_code = None
+        if method == 'get' and not cold:
+            client.get(url)
+        for _ in range(iterations):
+            if method == 'delete':
+                client.post(url)
+            if cold:
+                self.forget_caches()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            status_code = response.status_code
+            queries = max(queries, len(context.captured_queries))
+            sql_time += sum(float(query['time'])
+                            for query in context.captured_queries) * 1000
+            if method == 'post':
+                client.delete(url)
+        percentiles = statistics.quantiles(timings, n=100) \
+            if len(timings) > 1 else timings * 99
+        return {
+            'name': name,
+            'status': status_code,
+            'queries': queries,
+            'sql_ms': sql_time / iterations,
+            'p50_ms': percentiles[49],
+            'p95_ms': percentiles[94],
+            'p99_ms': percentiles[98],
+        }
+
+    def report(self, results, budgets):
+        failures = []
+        self.stdout.write('{:<24} {:>6} {:>7} {:>8} {:>8} {:>8} {:>8}'.format(
+            'endpoint', 'status', 'queries', 'sql ms', 'p50 ms', 'p95 ms',
+            'p99 ms'
+        ))
+        for result in results:
+            budget = budgets.get(result['name'], {})
+            over = [
+                key for key in ('queries', 'sql_ms', 'p50_ms', 'p95_ms',
+                                'p99_ms')
+                if key in budget and result[key] > budget[key]
+            ]
+            if result['status'] >= 400:
+                over.append('status')
+            line = ('{name:<24} {status:>6} {queries:>7} {sql_ms:>8.1f} '
+                    '{p50_ms:>8.1f} {p95_ms:>8.1f} {p99_ms:>8.1f}').format(
+                **result
+            )
+            if over:
+                failures.append('{} ({})'.format(
+                    result['name'], ', '.join(over)
+                ))
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        return failures
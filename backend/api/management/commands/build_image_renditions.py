@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.images import build_image_renditions
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит превью изображений рецептов, для которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить превью для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_renditions=False)
+        built = failed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            try:
+                build_image_renditions(recipe_id, force=options['all'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write('{}: {}'.format(recipe_id, error))
+            else:
+                built += 1
+        self.stdout.write('Построено: {}, ошибок: {}'.format(built, failed))
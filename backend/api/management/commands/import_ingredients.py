@@ -0,0 +1,80 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import bump_catalogue
+from api.models import Ingredient
+
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def normalize(value):
+    return ' '.join(str(value).split())
+
+
+def read_csv(source):
+    for row in csv.reader(source):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(source):
+    head = source.read(1024).lstrip()
+    source.seek(0)
+    if head.startswith('['):
+        items = json.load(source)
+    else:
+        items = (json.loads(line) for line in source if line.strip())
+    for item in items:
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+class Command(BaseCommand):
+    help = 'Импортирует каталог ингредиентов из CSV или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'json'))
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Неизвестный формат файла: {}'.format(path))
+        before = Ingredient.objects.count()
+        read, skipped = 0, 0
+        with open(path, encoding='utf-8') as source:
+            rows = read_csv(source) if file_format == 'csv' \
+                else read_json(source)
+            while True:
+                chunk = list(islice(rows, options['batch_size']))
+                if not chunk:
+                    break
+                read += len(chunk)
+                batch = {}
+                for name, unit in chunk:
+                    name, unit = normalize(name).lower(), normalize(unit)
+                    if not name or not unit or len(name) > NAME_LENGTH \
+                            or len(unit) > UNIT_LENGTH:
+                        skipped += 1
+                        continue
+                    batch[name, unit] = Ingredient(
+                        name=name, measurement_unit=unit, search_name=name
+                    )
+                Ingredient.objects.bulk_create(
+                    batch.values(), ignore_conflicts=True
+                )
+        created = Ingredient.objects.count() - before
+        bump_catalogue(Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            'Прочитано: {}, добавлено: {}, пропущено: {}'.format(
+                read, created, skipped
+            )
+        ))
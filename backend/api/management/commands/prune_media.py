@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.images import RENDITIONS, rendition_name
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы медиа, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе указанного числа секунд: '
+                 'их рецепт может быть ещё не сохранён'
+        )
+
+    def walk(self, storage, path=''):
+        directories, files = storage.listdir(path)
+        for name in files:
+            yield os.path.join(path, name).replace('\\', '/')
+        for directory in directories:
+            yield from self.walk(storage, os.path.join(path, directory))
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        referenced = set()
+        for name in Recipe.objects.exclude(
+            image=''
+        ).values_list('image', flat=True).distinct().iterator():
+            referenced.add(name)
+            referenced.update(
+                rendition_name(name, rendition) for rendition in RENDITIONS
+            )
+        deadline = time.time() - options['min_age']
+        removed = size = 0
+        for name in self.walk(storage):
+            if name in referenced or \
+                    storage.get_modified_time(name).timestamp() > deadline:
+                continue
+            removed += 1
+            size += storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+        self.stdout.write('{}: {} файлов, {} байт'.format(
+            'Будет удалено' if options['dry_run'] else 'Удалено',
+            removed, size
+        ))
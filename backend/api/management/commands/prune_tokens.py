@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken, OutstandingToken
+)
+
+
+class Command(BaseCommand):
+    help = ('Удаляет истёкшие токены из OutstandingToken и BlacklistedToken '
+            'небольшими пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Пауза между пачками в секундах'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, что будет удалено'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options['batch_size']
+        expired = OutstandingToken.objects.filter(expires_at__lte=now)
+        if options['dry_run']:
+            self.stdout.write(
+                'Будет удалено: {} токенов, из них в чёрном списке {}'.format(
+                    expired.count(),
+                    BlacklistedToken.objects.filter(
+                        token__expires_at__lte=now
+                    ).count()
+                )
+            )
+            return
+        last_id = 0
+        tokens = blacklisted = 0
+        while True:
+            ids = list(expired.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(
+                    token_id__in=ids
+                ).delete()[0]
+                tokens += OutstandingToken.objects.filter(
+                    id__in=ids
+                ).only('id').delete()[0]
+            last_id = ids[-1]
+            self.stdout.write(
+                'Удалено токенов: {}, из чёрного списка: {}'.format(
+                    tokens, blacklisted
+                )
+            )
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            'Готово: удалено {} токенов, {} из чёрного списка'.format(
+                tokens, blacklisted
+            )
+        ))
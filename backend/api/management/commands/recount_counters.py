@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import CustomUser, Recipe, RecipeFavorite, Subscribe
+
+COUNTERS = (
+    (Recipe, 'favorites_count', RecipeFavorite, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+def recount(model, field, related_model, related_field):
+    total = related_model.objects.filter(
+        **{related_field: OuterRef('pk')}
+    ).order_by().values(related_field).annotate(
+        total=Count('id')
+    ).values('total')
+    return model.objects.update(
+        **{field: Coalesce(Subquery(total), 0)}
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                updated = recount(model, field, related_model, related_field)
+                self.stdout.write('{}.{}: {}'.format(
+                    model._meta.db_table, field, updated
+                ))
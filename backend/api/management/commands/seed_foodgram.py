@@ -0,0 +1,200 @@
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from api.cache import bump_catalogue
+from api.models import (CustomUser, Tag, Ingredient, Recipe,
+                        RecipeIngredient, RecipeTag, RecipeFavorite,
+                        Subscribe, ShoppingList)
+
+SEED_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def zipf_weights(size, exponent):
+    return [1 / (rank + 1) ** exponent for rank in range(size)]
+
+
+def last_id(model):
+    return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Размер каталога, если он пуст')
+        parser.add_argument('--max-recipe-ingredients', type=int, default=15)
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Максимум избранного на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=20,
+                            help='Максимум подписок на пользователя')
+        parser.add_argument('--cart', type=int, default=40,
+                            help='Максимум рецептов в корзине')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        with transaction.atomic():
+            tag_ids = self.ensure_tags()
+            ingredient_ids = self.ensure_ingredients(options['ingredients'])
+            user_ids = self.create_users(options['users'])
+            recipes = self.create_recipes(user_ids, options['recipes'])
+            recipe_ids = [recipe_id for recipe_id, _ in recipes]
+            self.bulk(RecipeTag, self.recipe_tags(recipe_ids, tag_ids))
+            self.bulk(RecipeIngredient, self.recipe_ingredients(
+                recipe_ids, ingredient_ids,
+                options['max_recipe_ingredients']
+            ))
+            self.bulk(RecipeFavorite, self.favorites(
+                user_ids, recipes, options['favorites']
+            ))
+            self.bulk(Subscribe, self.subscriptions(
+                user_ids, options['subscriptions']
+            ))
+            self.bulk(ShoppingList, self.carts(
+                user_ids, recipe_ids, options['cart']
+            ))
+        call_command('recount_counters', stdout=self.stdout)
+        bump_catalogue(Tag)
+        bump_catalogue(Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            'Создано пользователей: {}, рецептов: {}'.format(
+                len(user_ids), len(recipe_ids)
+            )
+        ))
+
+    def bulk(self, model, objects):
+        total = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            total += len(batch)
+        self.stdout.write('{}: {}'.format(model._meta.db_table, total))
+
+    def skewed_sample(self, population, weights, count):
+        count = min(count, len(population))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.rnd.choices(
+                population, weights, k=count - len(chosen)
+            ))
+        return chosen
+
+    def skewed_count(self, maximum):
+        return min(maximum, int(self.rnd.paretovariate(self.skew)) - 1)
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in SEED_TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            self.bulk(Ingredient, (
+                Ingredient(name='ингредиент {}'.format(number),
+                           search_name='ингредиент {}'.format(number),
+                           measurement_unit=self.rnd.choice(('г', 'мл', 'шт')))
+                for number in range(count)
+            ))
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        start = last_id(CustomUser)
+        password = make_password('seed-password')
+        self.bulk(CustomUser, (
+            CustomUser(
+                username='seed{}'.format(start + number),
+                email='seed{}@example.com'.format(start + number),
+                first_name='Имя {}'.format(number),
+                last_name='Фамилия {}'.format(number),
+                password=password
+            )
+            for number in range(count)
+        ))
+        return list(CustomUser.objects.filter(
+            id__gt=start
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, user_ids, count):
+        start = last_id(Recipe)
+        weights = zipf_weights(len(user_ids), self.skew)
+        authors = (self.rnd.choices(user_ids, weights)[0]
+                   for _ in range(count))
+        self.bulk(Recipe, (
+            Recipe(
+                name='Рецепт {}'.format(start + number),
+                text='Описание рецепта {}'.format(start + number),
+                image='seed.png',
+                cooking_time=self.rnd.randint(1, 180),
+                author_id=author
+            )
+            for number, author in enumerate(authors)
+        ))
+        return list(Recipe.objects.filter(
+            id__gt=start
+        ).order_by('id').values_list('id', 'author_id'))
+
+    def recipe_tags(self, recipe_ids, tag_ids):
+        for recipe_id in recipe_ids:
+            count = self.rnd.randint(1, len(tag_ids))
+            for tag_id in self.rnd.sample(tag_ids, count):
+                yield RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+
+    def recipe_ingredients(self, recipe_ids, ingredient_ids, maximum):
+        weights = zipf_weights(len(ingredient_ids), self.skew)
+        for recipe_id in recipe_ids:
+            count = self.rnd.randint(1, maximum)
+            chosen = self.skewed_sample(ingredient_ids, weights, count)
+            for ingredient_id in chosen:
+                yield RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.rnd.randint(1, 500)
+                )
+
+    def favorites(self, user_ids, recipes, maximum):
+        weights = zipf_weights(len(recipes), self.skew)
+        for user_id in user_ids:
+            count = self.skewed_count(maximum)
+            for recipe_id, author_id in self.skewed_sample(
+                    recipes, weights, count):
+                yield RecipeFavorite(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id
+                )
+
+    def subscriptions(self, user_ids, maximum):
+        weights = zipf_weights(len(user_ids), self.skew)
+        for user_id in user_ids:
+            count = self.skewed_count(maximum)
+            authors = self.skewed_sample(user_ids, weights, count)
+            for author_id in authors - {user_id}:
+                yield Subscribe(user_id=user_id, author_id=author_id)
+
+    def carts(self, user_ids, recipe_ids, maximum):
+        weights = zipf_weights(len(recipe_ids), self.skew)
+        for user_id in user_ids:
+            count = self.skewed_count(maximum)
+            for recipe_id in self.skewed_sample(recipe_ids, weights, count):
+                yield ShoppingList(user_id=user_id, recipe_id=recipe_id)
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('api', 'Ingredient')
+    RecipeIngredient = apps.get_model('api', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        extra = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep']).values_list('id', flat=True))
+        merged = set(RecipeIngredient.objects.filter(
+            ingredient=group['keep']
+        ).values_list('recipe', flat=True))
+        for recipe_ingredient in RecipeIngredient.objects.filter(
+                ingredient__in=extra).order_by('id'):
+            if recipe_ingredient.recipe_id in merged:
+                recipe_ingredient.delete()
+                continue
+            recipe_ingredient.ingredient_id = group['keep']
+            recipe_ingredient.save(update_fields=['ingredient'])
+            merged.add(recipe_ingredient.recipe_id)
+        Ingredient.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='ingredient_uniq'),
+        ),
+    ]
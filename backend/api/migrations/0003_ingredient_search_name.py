@@ -0,0 +1,49 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+TRIGRAM_INDEX = 'ingredient_search_name_trgm'
+
+
+def fill_search_name(apps, schema_editor):
+    Ingredient = apps.get_model('api', 'Ingredient')
+    ingredients = list(Ingredient.objects.only('id', 'name'))
+    for ingredient in ingredients:
+        ingredient.search_name = ingredient.name.lower()
+    Ingredient.objects.bulk_update(
+        ingredients, ['search_name'], batch_size=1000
+    )
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS {} ON ingredient '
+        'USING gin (search_name gin_trgm_ops)'.format(TRIGRAM_INDEX)
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(TRIGRAM_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_ingredient_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200, verbose_name='Наименование для поиска'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
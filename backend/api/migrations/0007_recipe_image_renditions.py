@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_recipe_tag_tag_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Превью изображения построены'),
+        ),
+    ]
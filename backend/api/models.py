@@ -2,6 +2,8 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.db.models import CASCADE, UniqueConstraint
 
+from .storage import content_storage
+
 
 class CustomUser(AbstractUser):
     username = models.CharField(
@@ -25,6 +27,16 @@ class CustomUser(AbstractUser):
         max_length=90,
         verbose_name='Пароль пользователя',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписчиков'
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'password', 'first_name', 'last_name')
 
@@ -73,15 +85,30 @@ class Ingredient(models.Model):
         max_length=200,
         verbose_name='Вес'
     )
+    search_name = models.CharField(
+        max_length=200,
+        db_index=True,
+        editable=False,
+        verbose_name='Наименование для поиска'
+    )
 
     class Meta:
         db_table = 'ingredient'
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'], name='ingredient_uniq'
+            )
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.search_name = self.name.lower()
+        super().save(*args, **kwargs)
+
 
 class Recipe(models.Model):
     ingredients = models.ManyToManyField(
@@ -101,7 +128,16 @@ class Recipe(models.Model):
         verbose_name='Наименование'
     )
     text = models.TextField(verbose_name='Текст')
-    image = models.ImageField(verbose_name='Изображение')
+    image = models.ImageField(
+        upload_to='recipes/',
+        storage=content_storage,
+        verbose_name='Изображение'
+    )
+    image_renditions = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Превью изображения построены'
+    )
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время приготовления'
     )
@@ -111,6 +147,19 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Автор'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во добавлений в избранное'
+    )
 
     class Meta:
         db_table = 'recipe'
@@ -172,6 +221,9 @@ class RecipeTag(models.Model):
         constraints = [
             UniqueConstraint(fields=['recipe', 'tag'], name='recipe_tag_uniq')
         ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'], name='recipe_tag_tag_idx')
+        ]
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
 
@@ -1,6 +1,98 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from .cache import get_recipe_count, recipe_count_key, set_recipe_count
+from .utils import estimate_count
+
+
+class CountingPaginator(Paginator):
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.get_count = count
+
+    @cached_property
+    def count(self):
+        if self.get_count is None:
+            return super().count
+        return self.get_count(self.object_list)
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    page_size = 5
+    ordering = '-id'
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация, переключаемая на курсорную параметром
+    ``cursor`` (``?cursor=`` — первая страница ленты).
+
+    Представление с ``count_cache = True`` получает общее число записей
+    из кэша по нормализованному набору фильтров, а для ленты без фильтров
+    в PostgreSQL — из статистики планировщика. Параметры из
+    ``count_user_filters`` делают ключ кэша персональным.
+    """
     page_size_query_param = 'limit'
     page_size = 5
+    cursor_query_param = 'cursor'
+    cursor_pagination_class = CustomCursorPagination
+    count_ignored_params = ('page', 'limit', 'cursor', 'format')
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountingPaginator(object_list, per_page, count=self.get_count)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        self.request = request
+        self.view = view
+        self.count_exact = True
+        if self.cursor_query_param in request.query_params:
+            self.cursor = self.cursor_pagination_class()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_params(self):
+        params = self.request.query_params
+        return tuple(sorted(
+            (name, tuple(sorted(value for value in params.getlist(name)
+                                if value)))
+            for name in params if name not in self.count_ignored_params
+        ))
+
+    def get_count(self, queryset):
+        if not getattr(self.view, 'count_cache', False):
+            return queryset.count()
+        params = tuple(item for item in self.get_count_params() if item[1])
+        if not params:
+            estimate = estimate_count(queryset.model)
+            if estimate is not None and \
+                    estimate >= settings.RECIPE_COUNT_ESTIMATE_THRESHOLD:
+                self.count_exact = False
+                return estimate
+        user_filters = getattr(self.view, 'count_user_filters', ())
+        user_id = None
+        if any(name in user_filters for name, value in params):
+            user_id = self.request.user.id
+        key = recipe_count_key(params, user_id)
+        count = get_recipe_count(key)
+        if count is None:
+            count = queryset.count()
+            set_recipe_count(key, count)
+        return count
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
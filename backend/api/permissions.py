@@ -7,5 +7,11 @@ class OwnerPermission(permissions.BasePermission):
 
 
 class IsNotSelfPermission(permissions.BasePermission):
+    message = 'Нельзя подписаться на самого себя'
+
+    def has_permission(self, request, view):
+        return str(view.kwargs.get(view.target_url_kwarg)) != \
+            str(request.user.id)
+
     def has_object_permission(self, request, view, obj):
         return request.user.is_authenticated and request.user != obj.author
@@ -1,17 +1,21 @@
-import asyncio
+import os
 from abc import ABC
+from functools import partial
 
-from asgiref.sync import sync_to_async
 from django.core.validators import validate_email
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.serializers import ModelSerializer, Serializer
 from rest_framework_simplejwt import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .custom_serializer_field import Base64ImageField
+from .cache import tag_catalogue, ingredient_catalogue
+from .custom_serializer_field import Base64ImageField, ImageRenditionsField
 from .exception import CustomApiException
+from .jobs import enqueue_image_renditions
 from .models import (CustomUser, Tag, Recipe, Ingredient,
                      RecipeIngredient, RecipeFavorite, Subscribe,
                      ShoppingList, RecipeTag)
@@ -51,6 +55,8 @@ class ProfileSerializer(ModelSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscribe.objects.filter(
             user=self.context['request'].user.id, author=obj.id
         ).exists()
@@ -71,7 +77,7 @@ class TagSerializer(ModelSerializer):
 class IngredientSerializer(ModelSerializer):
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class IngredientRecipeSerializer(ModelSerializer):
@@ -81,9 +87,7 @@ class IngredientRecipeSerializer(ModelSerializer):
 
 
 class RecipeIngredientSerializer(ModelSerializer):
-    id = serializers.serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
@@ -108,99 +112,128 @@ class RecipePostOrUpdateSerializer(ModelSerializer):
             user=self.context['request'].user.id, author=obj.author.id
         ).exists()
 
+    def validate_ingredients(self, value):
+        ingredients = Ingredient.objects.in_bulk(
+            {item['id'] for item in value}
+        )
+        missing = {item['id'] for item in value}.difference(ingredients)
+        if missing:
+            raise ValidationError(
+                'Ингредиенты не найдены: {}'.format(sorted(missing))
+            )
+        unique_ing = {}
+        for item in value:
+            unique_ing[item['id']] = {
+                'id': ingredients[item['id']], 'amount': item['amount']
+            }
+        return list(unique_ing.values())
+
+    def validate_tags(self, value):
+        try:
+            tag_ids = list(dict.fromkeys(int(tag) for tag in value))
+        except (TypeError, ValueError):
+            raise ValidationError('Теги передаются списком id')
+        missing = set(tag_ids).difference(Tag.objects.in_bulk(tag_ids))
+        if missing:
+            raise ValidationError(
+                'Теги не найдены: {}'.format(sorted(missing))
+            )
+        return tag_ids
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.get('recipe_ingredients')
-        unique_ing = {v['id']: v for v in ingredients}.values()
         tags = validated_data.get('tags')
-        recipe_instance = Recipe(
+        recipe_instance = Recipe.objects.create(
             text=validated_data.get('text'),
             name=validated_data.get('name'),
             cooking_time=validated_data.get('cooking_time'),
             author=self.context['request'].user,
             image=validated_data.get('image')
         )
-        recipe_instance.save()
-
-        @sync_to_async
-        def create_ing():
-            for ingredient in unique_ing:
-                RecipeIngredient.objects.create(
-                    recipe=recipe_instance,
-                    ingredient=ingredient['id'],
-                    amount=ingredient['amount']
-                )
-
-        @sync_to_async
-        def create_tag():
-            for tag in tags:
-                RecipeTag.objects.create(
-                    recipe=recipe_instance,
-                    tag=get_object_or_404(Tag, id=tag)
-                )
-
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(asyncio.gather(
-            create_ing(),
-            create_tag()
-        ))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe_instance,
+                ingredient=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe_instance, tag_id=tag) for tag in tags
+        )
+        transaction.on_commit(
+            partial(enqueue_image_renditions, recipe_instance.id)
+        )
         return recipe_instance
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.get('recipe_ingredients')
-        tags = validated_data.get('tags')
-        recipe_data = dict(
-            filter(
-                lambda kv: kv[0] not in ['recipe_ingredients', 'tags'],
-                validated_data.items()
+        ingredients = validated_data.pop('recipe_ingredients', None)
+        tags = validated_data.pop('tags', None)
+        image = validated_data.get('image')
+        if image and instance.image and \
+                os.path.basename(instance.image.name) == image.name:
+            validated_data.pop('image')
+        elif image:
+            validated_data['image_renditions'] = False
+            transaction.on_commit(
+                partial(enqueue_image_renditions, instance.id)
             )
-        )
-        instance = super().update(instance, recipe_data)
+        instance = super().update(instance, validated_data)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        return instance
 
-        @sync_to_async
-        def update_ing():
-            obj = RecipeIngredient.objects.filter(recipe=instance)
-            obj.exclude(
-                ingredient__in=[element['id'].id for element in ingredients]
+    def update_ingredients(self, instance, ingredients):
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=instance)
+        }
+        wanted = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = set(current).difference(wanted)
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=instance, ingredient__in=removed
             ).delete()
-            for ingredient in ingredients:
-                current_obj = obj.filter(ingredient=ingredient['id'].id)
-                if current_obj.exists():
-                    current_obj.update(
-                        ingredient=ingredient['id'].id,
-                        amount=ingredient['amount']
-                    )
-                else:
-                    RecipeIngredient.objects.create(
-                        recipe=instance,
-                        ingredient=ingredient['id'],
-                        amount=ingredient['amount']
-                    )
-
-        @sync_to_async
-        def update_tag():
-            recipe_tag = instance.recipe_tag.all()
-            recipe_tag_values = recipe_tag.values_list('tag', flat=True)
-            delete_id = list(set(recipe_tag_values).difference(
-                tags))
-            if len(delete_id) != 0:
-                recipe_tag.filter(tag__in=delete_id).delete()
-            if sorted(recipe_tag_values) != sorted((tags + delete_id)):
-                for tag in tags:
-                    current_obj = recipe_tag.filter(tag=tag)
-                    if current_obj.exists():
-                        current_obj.update(tag=get_object_or_404(Tag, id=tag))
-                    else:
-                        RecipeTag.objects.create(
-                            recipe=instance,
-                            tag=get_object_or_404(Tag, id=tag)
-                        )
-
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(asyncio.gather(
-            update_ing(),
-            update_tag()
-        ))
-        return instance
+        changed = []
+        for ingredient_id, amount in wanted.items():
+            row = current.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        inserted = [
+            RecipeIngredient(
+                recipe=instance, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in wanted.items()
+            if ingredient_id not in current
+        ]
+        if inserted:
+            RecipeIngredient.objects.bulk_create(inserted)
+
+    def update_tags(self, instance, tags):
+        current = set(
+            RecipeTag.objects.filter(
+                recipe=instance
+            ).values_list('tag', flat=True)
+        )
+        removed = current.difference(tags)
+        if removed:
+            RecipeTag.objects.filter(recipe=instance, tag__in=removed).delete()
+        inserted = [
+            RecipeTag(recipe=instance, tag_id=tag)
+            for tag in tags if tag not in current
+        ]
+        if inserted:
+            RecipeTag.objects.bulk_create(inserted)
 
     def to_representation(self, instance):
         ingredients = self.fields['ingredients']
@@ -261,12 +294,24 @@ class RelatedIngredientRecipeSerializer(ModelSerializer):
         model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
+    def to_representation(self, instance):
+        catalogue = self.context.get('ingredients') or ingredient_catalogue()
+        ingredient = catalogue.get(instance.ingredient_id)
+        if ingredient is None:
+            return super().to_representation(instance)
+        return {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+            'amount': instance.amount
+        }
+
 
 class RecipeGetSerializer(ModelSerializer):
     ingredients = RelatedIngredientRecipeSerializer(
         source='recipe_ingredients', many=True
     )
-    tags = TagSerializer(many=True, read_only=True)
+    tags = serializers.serializers.SerializerMethodField(read_only=True)
     author = ProfileSerializer(read_only=True)
     is_favorited = serializers.serializers.SerializerMethodField(
         read_only=True
@@ -274,19 +319,40 @@ class RecipeGetSerializer(ModelSerializer):
     is_in_shopping_cart = serializers.serializers.SerializerMethodField(
         read_only=True
     )
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'ingredients', 'tags', 'text', 'name',
-                  'cooking_time', 'author', 'image', 'is_favorited',
-                  'is_in_shopping_cart')
+                  'cooking_time', 'author', 'image', 'image_renditions',
+                  'is_favorited', 'is_in_shopping_cart')
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def get_tags(self, obj):
+        catalogue = self.context.get('tags') or tag_catalogue()
+        tags = []
+        for recipe_tag in obj.recipe_tag.all():
+            tag = catalogue.get(recipe_tag.tag_id)
+            if tag is None:
+                tags.append(TagSerializer(recipe_tag.tag).data)
+            else:
+                tags.append(tag._asdict())
+        return tags
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return RecipeFavorite.objects.filter(
             user=self.context['request'].user.id, recipe=obj.id
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return ShoppingList.objects.filter(
             user=self.context['request'].user.id, recipe=obj.id
         ).exists()
@@ -296,6 +362,7 @@ class RecipeResponseSerializer(Serializer):
     id = serializers.serializers.IntegerField(read_only=True)
     name = serializers.serializers.CharField(read_only=True)
     image = serializers.serializers.ImageField(read_only=True)
+    image_renditions = ImageRenditionsField()
     cooking_time = serializers.serializers.IntegerField(read_only=True)
 
 
@@ -361,8 +428,7 @@ class SubscribeResponseSerializer(Serializer):
         ).data
 
     def get_recipes_count(self, obj):
-        qs = obj.recipes.all()
-        return qs.count()
+        return obj.recipes_count
 
     def get_is_subscribed(self, obj):
         return Subscribe.objects.filter(
@@ -390,21 +456,20 @@ class SubscribeGetSerializer(ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        limit = int(self.context['request'].query_params.get('recipes_limit'))
-        queryset = obj.author.recipes.all()[:limit]
+        recipes = self.context.get('recipes')
+        if recipes is None:
+            recipes = obj.author.recipes.all()
+        else:
+            recipes = recipes.get(obj.author_id, [])
         return RecipeSubscribeGetSerializer(
-            queryset, many=True, context={'request': self.context['request']}
+            recipes, many=True, context={'request': self.context['request']}
         ).data
 
     def get_recipes_count(self, obj):
-        limit = int(self.context['request'].query_params.get('recipes_limit'))
-        qs = obj.author.recipes.all()[:limit]
-        return qs.count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
-        return Subscribe.objects.filter(
-            user=self.context['request'].user.id, author=obj.author
-        ).exists()
+        return obj.user_id == self.context['request'].user.id
 
 
 class ShoppingListSerializer(ModelSerializer):
@@ -0,0 +1,111 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .cache import (forget_shopping_lists, bump_catalogue,
+                    forget_recipe_counts, forget_user_snapshots)
+from .models import (CustomUser, Ingredient, Recipe, RecipeFavorite,
+                     RecipeTag, ShoppingList, Subscribe, Tag)
+
+
+def change_counter(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+@receiver([post_save, post_delete], sender=ShoppingList)
+def shopping_list_changed(sender, instance, **kwargs):
+    forget_shopping_lists([instance.user_id])
+    forget_recipe_counts(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=RecipeFavorite)
+@receiver([post_save, post_delete], sender=Subscribe)
+def favorites_changed(sender, instance, **kwargs):
+    forget_recipe_counts(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver(post_save, sender=RecipeTag)
+def recipes_changed(sender, instance, **kwargs):
+    forget_recipe_counts()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    forget_shopping_lists(ShoppingList.objects.filter(
+        recipe=instance.id
+    ).values_list('user', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    forget_shopping_lists(ShoppingList.objects.filter(
+        recipe__recipe_ingredients__ingredient=instance.id
+    ).values_list('user', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def catalogue_changed(sender, instance, **kwargs):
+    bump_catalogue(sender)
+
+
+@receiver(post_save, sender=RecipeFavorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=RecipeFavorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(CustomUser, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(CustomUser, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            CustomUser, instance.author_id, 'subscribers_count', 1
+        )
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscribe_deleted(sender, instance, **kwargs):
+    change_counter(CustomUser, instance.author_id, 'subscribers_count', -1)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    forget_user_snapshots(instance.id)
+    # Профиль автора входит в выдачу рецептов; вход обновляет только
+    # last_login.
+    if not update_fields or set(update_fields) != {'last_login'}:
+        forget_recipe_counts()
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user_snapshots(user.id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, **kwargs):
+    if instance.token.user_id is not None:
+        forget_user_snapshots(instance.token.user_id)
@@ -0,0 +1,35 @@
+import os
+from uuid import uuid4
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище для файлов, названных по хешу содержимого: одинаковые файлы
+    записываются один раз, повторное сохранение возвращает то же имя.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            # Файл, на который ещё никто не ссылается, мог пролежать
+            # дольше --min-age: свежий mtime не даёт prune_media удалить
+            # его до сохранения рецепта.
+            try:
+                os.utime(self.path(name))
+                return name.replace('\\', '/')
+            except FileNotFoundError:
+                pass
+        directory, filename = os.path.split(name)
+        temp_name = super()._save(
+            os.path.join(directory, '.{}.{}'.format(filename, uuid4().hex)),
+            content
+        )
+        os.replace(self.path(temp_name), self.path(name))
+        return name.replace('\\', '/')
+
+
+content_storage = ContentAddressedStorage()
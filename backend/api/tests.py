@@ -0,0 +1,57 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import CustomUser
+
+
+class SubscriptionsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='reader@foodgram.ru', username='reader', password='pass',
+            first_name='Читатель', last_name='Читателев'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_empty_subscriptions_with_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=3&limit=3'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['results'], [])
+
+    def test_subscriptions_require_authentication(self):
+        response = APIClient().get(
+            '/api/users/subscriptions/?recipes_limit=3'
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ShoppingDownloadTests(TestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@foodgram.ru', username='buyer', password='pass',
+            first_name='Покупатель', last_name='Покупателев'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unacceptable_accept_falls_back_to_pdf(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_format_wins_over_accept(self):
+        response = self.client.get(
+            self.url + '?format=csv', HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(self.url + '?format=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('format', response.json())
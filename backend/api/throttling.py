@@ -0,0 +1,162 @@
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+logger = logging.getLogger(__name__)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class SlidingWindowStore(ABC):
+    """
+    Хранилище счётчиков скользящего окна: на клиента — номер текущего
+    окна и число запросов в текущем и предыдущем окнах.
+    """
+
+    @abstractmethod
+    def hit(self, key, limit, duration, now):
+        """
+        Учитывает запрос и возвращает пару (разрешён ли он, сколько секунд
+        ждать, если нет).
+        """
+
+    @staticmethod
+    def count(window, current, previous, limit, duration, now):
+        index = int(now // duration)
+        if window == index - 1:
+            current, previous = 0, current
+        elif window != index:
+            current, previous = 0, 0
+        elapsed = now - index * duration
+        weight = 1 - elapsed / duration
+        if previous * weight + current + 1 <= limit:
+            return index, current + 1, previous, None
+        if current + 1 > limit or previous == 0:
+            wait = duration - elapsed
+        else:
+            wait = (1 - (limit - current - 1) / previous) * duration - elapsed
+        return index, current, previous, max(wait, 0)
+
+
+class SQLiteSlidingWindowStore(SlidingWindowStore):
+    """
+    Общие для всех воркеров одного хоста счётчики в файле SQLite
+    в режиме WAL. Проверка и обновление — одна короткая транзакция.
+    """
+
+    def __init__(self, path, timeout=1.0, cleanup_probability=0.001):
+        self.path = path
+        self.timeout = timeout
+        self.cleanup_probability = cleanup_probability
+        self.local = threading.local()
+
+    def connect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None and self.local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS throttle ('
+            'key TEXT PRIMARY KEY, window INTEGER NOT NULL, '
+            'current INTEGER NOT NULL, previous INTEGER NOT NULL, '
+            'expires REAL NOT NULL) WITHOUT ROWID'
+        )
+        self.local.connection = connection
+        self.local.pid = os.getpid()
+        return connection
+
+    def hit(self, key, limit, duration, now):
+        # Недоступное хранилище (занято дольше timeout, нет прав на файл)
+        # не должно ронять каждый запрос API: он пропускается без учёта.
+        try:
+            return self.update(key, limit, duration, now)
+        except sqlite3.Error as error:
+            logger.warning(
+                'Счётчики ограничения частоты недоступны (%s): %s',
+                self.path, error
+            )
+            return True, None
+
+    def update(self, key, limit, duration, now):
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT window, current, previous FROM throttle '
+                'WHERE key = ?', (key,)
+            ).fetchone()
+            window, current, previous, wait = self.count(
+                *(row or (None, 0, 0)), limit, duration, now
+            )
+            connection.execute(
+                'INSERT OR REPLACE INTO throttle '
+                '(key, window, current, previous, expires) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, window, current, previous, (window + 2) * duration)
+            )
+            if random.random() < self.cleanup_probability:
+                connection.execute(
+                    'DELETE FROM throttle WHERE expires < ?', (now,)
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        return wait is None, wait
+
+
+def get_throttle_store():
+    backend = settings.THROTTLE_STORE
+    store = _stores.get(backend)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(backend)
+            if store is None:
+                store = import_string(backend)(
+                    **settings.THROTTLE_STORE_OPTIONS
+                )
+                _stores[backend] = store
+    return store
+
+
+class SlidingWindowThrottleMixin:
+    """
+    Ограничение частоты по приближённому скользящему окну в общем для
+    процессов хранилище вместо списка отметок времени в кэше.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        allowed, self.wait_seconds = get_throttle_store().hit(
+            self.key, self.num_requests, self.duration, self.timer()
+        )
+        return allowed
+
+    def wait(self):
+        return math.ceil(self.wait_seconds)
+
+
+class UserSlidingWindowThrottle(SlidingWindowThrottleMixin, UserRateThrottle):
+    pass
+
+
+class AnonSlidingWindowThrottle(SlidingWindowThrottleMixin, AnonRateThrottle):
+    pass
@@ -4,7 +4,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (logout_user, CustomTokenObtainPairView, RecipeViewSet,
                     TagViewSet, IngredientViewSet, FavoriteViewSet,
                     SubscribeViewSet, SubscribeListView, ShoppingListViewSet,
-                    ShoppingDownloadView, CustomUserViewSet)
+                    ShoppingDownloadView, ShoppingDownloadJobView,
+                    CustomUserViewSet)
 
 router_v1 = DefaultRouter()
 
@@ -19,6 +20,11 @@ urlpatterns = [
         ShoppingDownloadView.as_view(),
         name='download_shopping_cart'
     ),
+    path(
+        'recipes/download_shopping_cart/<str:job_id>/',
+        ShoppingDownloadJobView.as_view(),
+        name='download_shopping_cart_job'
+    ),
     path(
         'users/subscriptions/',
         SubscribeListView.as_view(),
@@ -1,13 +1,107 @@
 import base64
+import binascii
+import csv
 import os
 import random
 import string
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.http import HttpResponse
+from django.core.files.base import File
+from django.db import connection
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template.loader import get_template
+from rest_framework.exceptions import ValidationError
+
+from .cache import (shopping_list_digest, get_shopping_list_pdf,
+                    set_shopping_list_pdf)
+from .models import Recipe, RecipeIngredient
+
+# Кратно 4, чтобы каждый кусок base64 декодировался отдельно.
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def estimate_count(model):
+    """Оценка числа строк по статистике планировщика PostgreSQL."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def insert_ignore(model, **values):
+    """
+    Один INSERT ... ON CONFLICT DO NOTHING: возвращает число вставленных
+    строк, 0 — если запись уже есть.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in values]
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            field.get_db_prep_value(value, connection)
+            for field, value in zip(fields, values.values())
+        ])
+        return cursor.rowcount
+
+
+def delete_rows(model, **values):
+    """Один DELETE без сбора связанных объектов и сигналов."""
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in values]
+    sql = 'DELETE FROM {} WHERE {}'.format(
+        quote_name(model._meta.db_table),
+        ' AND '.join(
+            '{} = %s'.format(quote_name(field.column)) for field in fields
+        )
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            field.get_db_prep_value(value, connection)
+            for field, value in zip(fields, values.values())
+        ])
+        return cursor.rowcount
+
+
+def latest_recipes(author_ids, limit=None):
+    """Последние рецепты каждого автора одним запросом."""
+    if not author_ids:
+        return {}
+    queryset = Recipe.objects.filter(
+        author_id__in=author_ids
+    ).only('id', 'name', 'image', 'cooking_time', 'author_id')
+    if limit is None:
+        recipes = queryset.order_by('author_id', '-id')
+    else:
+        ranked = queryset.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('id').desc(),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            'SELECT * FROM ({}) ranked WHERE row_number <= %s '
+            'ORDER BY author_id, id DESC'.format(sql),
+            params + (limit,)
+        )
+    result = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        result[recipe.author_id].append(recipe)
+    return result
 
 
 class Converter:
@@ -15,14 +109,84 @@ class Converter:
     def get_file_from_base64(serialize_file):
         format, imgstr = serialize_file.split(';base64,')
         ext = format.split('/')[-1]
-        return ContentFile(
-            base64.b64decode(imgstr),
+        if len(imgstr) // 4 * 3 > settings.RECIPE_IMAGE_MAX_BYTES:
+            raise ValidationError('Изображение больше {} байт'.format(
+                settings.RECIPE_IMAGE_MAX_BYTES
+            ))
+        content = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        chunk_size = BASE64_CHUNK_SIZE
+        try:
+            for start in range(0, len(imgstr), chunk_size):
+                content.write(base64.b64decode(
+                    imgstr[start:start + chunk_size], validate=True
+                ))
+        except binascii.Error:
+            content.close()
+            raise ValidationError('Некорректное содержимое base64')
+        content.seek(0)
+        return File(
+            content,
             name='temp.' + imgstr[:15] +
                  ''.join(random.choices(string.ascii_lowercase, k=15)) +
                  '.' + ext
         )
 
 
+def aggregate_shopping_cart(user):
+    return RecipeIngredient.objects.filter(
+        recipe__shopped__user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit')
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('name', 'measurement_unit')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iterate_shopping_cart(user, chunk_size=2000):
+    return aggregate_shopping_cart(user).iterator(chunk_size=chunk_size)
+
+
+def shopping_list_txt(user):
+    for item in iterate_shopping_cart(user):
+        yield '{} ({}) - {}\n'.format(
+            item['name'], item['measurement_unit'], item['total_amount']
+        )
+
+
+def shopping_list_csv(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in iterate_shopping_cart(user):
+        yield writer.writerow((
+            item['name'], item['measurement_unit'], item['total_amount']
+        ))
+
+
+SHOPPING_LIST_STREAMS = {
+    'txt': (shopping_list_txt, 'text/plain; charset=utf-8'),
+    'csv': (shopping_list_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def stream_shopping_list(user, export_format):
+    generator, content_type = SHOPPING_LIST_STREAMS[export_format]
+    response = StreamingHttpResponse(
+        generator(user), content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        'attachment; filename="shopping_list.{}"'.format(export_format)
+    )
+    return response
+
+
 def fetch_pdf_resources(uri, rel):
     if uri.find(settings.STATIC_URL) != -1:
         return os.path.join(settings.STATIC_ROOT, uri.replace(settings.STATIC_URL, ''))
@@ -35,8 +199,24 @@ def render_to_pdf(template_src, context=None):
         context = {}
     template = get_template(template_src)
     html = template.render(context)
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(html.encode('utf-8')), result, link_callback=fetch_pdf_resources)
+    response = HttpResponse(content_type='application/pdf')
+    pdf = pisa.pisaDocument(BytesIO(html.encode('utf-8')), response, link_callback=fetch_pdf_resources)
     if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
+        return response
     return None
+
+
+def render_shopping_list_pdf(user):
+    shopping_list = list(aggregate_shopping_cart(user))
+    digest = shopping_list_digest(user.username, shopping_list)
+    content = get_shopping_list_pdf(digest)
+    if content is None:
+        pdf = render_to_pdf('shopping_list.html', {
+            'user_username': user.username,
+            'shopping_list': shopping_list,
+        })
+        if pdf is None:
+            return None
+        content = pdf.content
+        set_shopping_list_pdf(user.id, digest, content)
+    return HttpResponse(content, content_type='application/pdf')
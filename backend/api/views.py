@@ -1,23 +1,24 @@
 from django.contrib.auth import logout
-from django.db.models import F
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.http import HttpResponse
 from djoser.views import UserViewSet
-from rest_framework import authentication as auth
 from rest_framework import permissions, generics
 from rest_framework import status, viewsets
 from rest_framework.decorators import api_view
-from rest_framework.generics import get_object_or_404
-from rest_framework.request import Request
+from rest_framework.exceptions import NotAcceptable, ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.validators import UniqueTogetherValidator
-from rest_framework_simplejwt import authentication as jwt_auth
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .custom_mixin import CustomMixin, CustomCreateDestroyViewSet
+from .authentication import JWTOrSessionAuthentication
+from .cache import (tag_catalogue, ingredient_catalogue,
+                    recipe_count_version)
+from .custom_mixin import (CustomMixin, CustomCreateDestroyViewSet,
+                           ConditionalGetMixin)
 from .filters import RecipeFilter, IngredientFilterSet
-from .models import (Tag, Ingredient, Recipe,
-                     RecipeFavorite, Subscribe,
-                     ShoppingList)
+from .models import (CustomUser, Tag, Ingredient, Recipe,
+                     RecipeFavorite, Subscribe, ShoppingList)
 from .pagination import CustomPagination
 from .permissions import OwnerPermission, IsNotSelfPermission
 from .serializers import (CustomSerializer, TagSerializer,
@@ -28,7 +29,10 @@ from .serializers import (CustomSerializer, TagSerializer,
                           ShoppingListSerializer, ProfileSerializer,
                           ProfileCreateSerializer, RecipeResponseSerializer,
                           SubscribeResponseSerializer)
-from .utils import render_to_pdf
+from .jobs import enqueue_shopping_list, get_job, JOB_DONE
+from .renderers import PDFRenderer, PlainTextRenderer, CSVRenderer
+from .utils import (latest_recipes, render_shopping_list_pdf,
+                    stream_shopping_list, SHOPPING_LIST_STREAMS)
 
 
 class CustomUserViewSet(UserViewSet):
@@ -58,37 +62,99 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomSerializer
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
+    def get_etag(self, request):
+        return '{}:{}'.format(
+            tag_catalogue().version, request.get_full_path()
+        )
+
+    def get_last_modified(self, request):
+        return tag_catalogue().modified
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, self.list_catalogue)
+
+    def list_catalogue(self, request):
+        return Response(tag_catalogue().values())
 
-class IngredientViewSet(CustomMixin):
+
+class IngredientViewSet(ConditionalGetMixin, CustomMixin):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilterSet
 
+    def get_etag(self, request):
+        return '{}:{}'.format(
+            ingredient_catalogue().version, request.get_full_path()
+        )
+
+    def get_last_modified(self, request):
+        return ingredient_catalogue().modified
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, self.list_catalogue)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def list_catalogue(self, request):
+        if request.query_params.get('name'):
+            return super().list(request)
+        return Response(ingredient_catalogue().values())
+
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    authentication_classes = [JWTOrSessionAuthentication]
     pagination_class = CustomPagination
     filterset_class = RecipeFilter
+    vary_headers = ('Authorization',)
+    count_cache = True
+    count_user_filters = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_etag(self, request):
+        # Любая запись рецептов, их тегов и авторов меняет общую версию,
+        # а избранное, корзина и подписки — версию пользователя, так что
+        # валидатор не требует запросов к рецептам.
+        self.recipes_version = recipe_count_version(request.user.id)
+        return '{}:{}:{}:{}'.format(
+            request.get_full_path(), self.recipes_version,
+            tag_catalogue().version, ingredient_catalogue().version
+        )
+
+    def get_last_modified(self, request):
+        if request.user.is_authenticated:
+            return None
+        return int(float(self.recipes_version))
 
-    def get_authenticators(self):
-        request = Request(
-            self.request,
-            parsers=self.get_parsers(),
-            authenticators=super(RecipeViewSet, self).get_authenticators(),
-            negotiator=self.get_content_negotiator(),
-            parser_context=self.get_parser_context(self.request)
+    def get_queryset(self):
+        if self.request.method != 'GET':
+            return self.queryset
+        user = self.request.user.id
+        return self.queryset.select_related(
+            'author'
+        ).prefetch_related(
+            'recipe_tag', 'recipe_ingredients'
+        ).annotate(
+            is_favorited=Exists(RecipeFavorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author')
+            ))
         )
-        try:
-            if request.user.is_anonymous and self.request.method == 'GET':
-                return [auth.SessionAuthentication()]
-        except:
-            return [auth.SessionAuthentication()]
-        return [jwt_auth.JWTAuthentication()]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context.update(
+                tags=tag_catalogue(), ingredients=ingredient_catalogue()
+            )
+        return context
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -97,120 +163,85 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return [OwnerPermission()]
         return [permissions.IsAuthenticated()]
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH', 'POST']:
             return RecipePostOrUpdateSerializer
         return RecipeGetSerializer
 
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(CustomCreateDestroyViewSet):
     queryset = RecipeFavorite.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = RecipeFavoriteSerializer
     response_serializer_class = RecipeResponseSerializer
     http_method_names = ['post', 'delete']
-    validators = [
-        UniqueTogetherValidator(
-            queryset=RecipeFavorite.objects.all(),
-            fields=('user', 'author', 'recipe'),
-        )
-    ]
+    target_model = Recipe
+    target_field = 'recipe'
+    target_url_kwarg = 'recipe_id'
+    target_fields = ('id', 'name', 'image', 'image_renditions',
+                     'cooking_time', 'author_id')
+    already_exists_message = 'Рецепт уже в избранном'
 
-    def get_serializer_class(self):
-        if self.action == 'create':
-            self.serializer_class.Meta.validators = self.validators
-            return self.serializer_class
-        self.serializer_class.Meta.validators = []
-        return super().get_serializer_class()
-
-    def create(self, request, *args, **kwargs):
-        data = {
-            'recipe': self.kwargs.get('recipe_id'),
-            'user': request.user.id,
-            'author': get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('recipe_id')
-            ).author.id
-        }
-        serializer = self.get_serializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(self.response_serializer_class(
-            serializer.validated_data.get('recipe'),
-            context={'request': request}).data, status=status.HTTP_200_OK)
-
-    def destroy(self, request, *args, **kwargs):
-        data = {
-            'recipe': self.kwargs.get('recipe_id'),
-            'user': request.user.id,
-            'author': get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('recipe_id')
-            ).author.id
-        }
-        serializer = self.get_serializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        self.queryset.filter(
-            recipe=serializer.validated_data.get('recipe'),
-            user=serializer.validated_data.get('user'),
-            author=serializer.validated_data.get('author')
-        ).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def get_link_values(self, target):
+        values = super().get_link_values(target)
+        values['author'] = target.author_id
+        return values
 
 
 class SubscribeViewSet(CustomCreateDestroyViewSet):
     queryset = Subscribe.objects.all()
-    permission_classes = [IsNotSelfPermission]
+    permission_classes = [permissions.IsAuthenticated, IsNotSelfPermission]
     serializer_class = SubscribeSerializer
     response_serializer_class = SubscribeResponseSerializer
     http_method_names = ['post', 'delete']
-    validators = [
-        UniqueTogetherValidator(
-            queryset=Subscribe.objects.all(),
-            fields=('user', 'author')
-        )
-    ]
-
-    def get_serializer_class(self):
-        if self.action == 'create':
-            self.serializer_class.Meta.validators = self.validators
-            return self.serializer_class
-        self.serializer_class.Meta.validators = []
-        return super().get_serializer_class()
-
-    def create(self, request, *args, **kwargs):
-        data = {
-            'user': request.user.id,
-            'author': self.kwargs.get('author_id')
-        }
-        return super().create(
-            request, data, self.response_serializer_class,
-            'author', *args, **kwargs
-        )
-
-    def destroy(self, request, *args, **kwargs):
-        data = {
-            'user': request.user.id,
-            'author': self.kwargs.get('author_id')
-        }
-        obj = self.queryset.filter(
-            user=data.get('user'),
-            author=data.get('author')
-        )
-        return super().destroy(
-            request, data, obj, *args, **kwargs
-        )
+    target_model = CustomUser
+    target_field = 'author'
+    target_url_kwarg = 'author_id'
+    target_fields = ('id', 'email', 'username', 'first_name', 'last_name',
+                     'recipes_count')
+    already_exists_message = 'Вы уже подписаны на этого автора'
 
 
 class SubscribeListView(generics.ListAPIView):
     queryset = Subscribe.objects.all()
+    permission_classes = [permissions.IsAuthenticated]
     serializer_class = SubscribeGetSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
         return self.queryset.filter(
             user=self.request.user.id
+        ).select_related('author').order_by('-id')
+
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is None:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Укажите неотрицательное целое число'}
+            )
+        return limit
+
+    def list(self, request, *args, **kwargs):
+        limit = self.get_recipes_limit()
+        page = self.paginate_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        context['recipes'] = latest_recipes(
+            [subscribe.author_id for subscribe in page], limit
         )
+        serializer = self.get_serializer_class()(
+            page, many=True, context=context
+        )
+        return self.get_paginated_response(serializer.data)
 
 
 class ShoppingListViewSet(CustomCreateDestroyViewSet):
@@ -219,62 +250,92 @@ class ShoppingListViewSet(CustomCreateDestroyViewSet):
     serializer_class = ShoppingListSerializer
     response_serializer_class = RecipeResponseSerializer
     http_method_names = ['post', 'delete']
-    validators = [
-        UniqueTogetherValidator(
-            queryset=ShoppingList.objects.all(),
-            fields=('user', 'recipe'),
-        )
-    ]
-
-    def get_serializer_class(self):
-        if self.action == 'create':
-            self.serializer_class.Meta.validators = self.validators
-            return self.serializer_class
-        self.serializer_class.Meta.validators = []
-        return super().get_serializer_class()
-
-    def create(self, request, *args, **kwargs):
-        data = {
-            'user': request.user.id,
-            'recipe': self.kwargs.get('recipe_id')
-        }
-        return super().create(
-            request, data, self.response_serializer_class,
-            'recipe', *args, **kwargs
-        )
-
-    def destroy(self, request, *args, **kwargs):
-        data = {
-            'user': request.user.id,
-            'recipe': self.kwargs.get('recipe_id')
-        }
-        obj = self.queryset.filter(
-            user=data.get('user'),
-            recipe=data.get('recipe')
-        )
-        return super(ShoppingListViewSet, self).destroy(
-            request, data, obj, *args, **kwargs
-        )
+    target_model = Recipe
+    target_field = 'recipe'
+    target_url_kwarg = 'recipe_id'
+    target_fields = ('id', 'name', 'image', 'image_renditions',
+                     'cooking_time')
+    already_exists_message = 'Рецепт уже в списке покупок'
 
 
 class ShoppingDownloadView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ShoppingListSerializer
     pagination_class = CustomPagination
+    renderer_classes = [PDFRenderer, PlainTextRenderer, CSVRenderer]
+
+    def get_renderers(self):
+        if self.request.method == 'POST':
+            return [JSONRenderer()]
+        return super().get_renderers()
+
+    def perform_content_negotiation(self, request, force=False):
+        # Клиенты, которым отдавался только PDF, могут присылать любой
+        # Accept: без явного ?format= они по-прежнему получают PDF.
+        if force:
+            return super().perform_content_negotiation(request, force)
+        export_format = request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        renderers = {
+            renderer.format: renderer for renderer in self.get_renderers()
+        }
+        if export_format and export_format not in renderers:
+            raise ValidationError({'format': 'Доступные форматы: {}'.format(
+                ', '.join(renderers)
+            )})
+        try:
+            return super().perform_content_negotiation(request)
+        except NotAcceptable:
+            if export_format:
+                renderer = renderers[export_format]
+                return renderer, renderer.media_type
+            return super().perform_content_negotiation(request, force=True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Файлы отдаются как HttpResponse, а Response здесь — только
+        # ошибки и статусы задач, поэтому они всегда в JSON.
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if isinstance(response, Response):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    def post(self, request, *args, **kwargs):
+        job_id, job = enqueue_shopping_list(request.user)
+        if job['status'] == JOB_DONE:
+            return Response(
+                {'id': job_id, 'status': job['status']},
+                status=status.HTTP_200_OK
+            )
+        return Response(
+            {'id': job_id, 'status': job['status']},
+            status=status.HTTP_202_ACCEPTED
+        )
 
     def get(self, request, *args, **kwargs):
-        context = {
-            'user_username': self.request.user.username,
-            'shopping_list': Recipe.objects.filter(
-                id=F('shopped__recipe'), shopped__user=self.request.user
-            ).select_related(
-                'author'
-            ).prefetch_related(
-                'ingredients'
-            ),
-        }
-        pdf = render_to_pdf('shopping_list.html', context)
+        export_format = request.accepted_renderer.format
+        if export_format in SHOPPING_LIST_STREAMS:
+            return stream_shopping_list(self.request.user, export_format)
+        pdf = render_shopping_list_pdf(self.request.user)
         if pdf:
-            response = HttpResponse(pdf, content_type='application/pdf')
-            return response
+            return pdf
         return Response(status=status.HTTP_400_BAD_REQUEST)
+
+
+class ShoppingDownloadJobView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        job_id = self.kwargs.get('job_id')
+        job = get_job(request.user, job_id)
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if job['status'] == JOB_DONE:
+            return HttpResponse(job['content'], content_type='application/pdf')
+        return Response(
+            {'id': job_id, 'status': job['status']},
+            status=status.HTTP_202_ACCEPTED
+        )
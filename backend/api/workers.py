@@ -0,0 +1,10 @@
+import os
+
+import django
+
+
+def start_worker(pids):
+    # Модуль не импортирует моделей: spawn-процесс загружает его до
+    # django.setup().
+    pids.put(os.getpid())
+    django.setup()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -30,7 +31,6 @@ INSTALLED_APPS = [
     'rest_framework',
     'corsheaders',
     'rest_framework_simplejwt.token_blacklist',
-    'api.custom_filters',
     'api',
     'djoser'
 ]
@@ -64,9 +64,6 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
-            'libraries': {
-                'custom_filters': 'api.custom_filters',
-            }
         },
     },
 ]
@@ -84,6 +81,77 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'foodgram_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        }
+    },
+    'stamps': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'STAMP_CACHE_PATH',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram-stamps')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        }
+    },
+    'shopping_list': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shopping_list',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 64,
+        }
+    }
+}
+
+# Не больше 32 МиБ PDF на процесс: 64 записи по 512 КиБ.
+SHOPPING_LIST_CACHE = 'shopping_list'
+SHOPPING_LIST_CACHE_MAX_SIZE = 512 * 1024
+
+PDF_RENDER_JOB_CACHE = 'shared'
+# Пул и очередь у каждого воркера сервера свои: всего на хосте до
+# PDF_RENDER_WORKERS и PDF_RENDER_QUEUE_SIZE на число воркеров.
+PDF_RENDER_WORKERS = 2
+PDF_RENDER_QUEUE_SIZE = 16
+PDF_RENDER_TIMEOUT = 60
+PDF_RENDER_RESULT_TTL = 10 * 60
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Версии каталогов и счётчиков: общие для воркеров хоста, без запросов к БД.
+STAMP_CACHE = 'stamps'
+STAMP_TTL = 60 * 60 * 24
+STAMP_CHECK_INTERVAL = 1
+
+RECIPE_COUNT_CACHE = 'default'
+RECIPE_COUNT_TTL = 30
+RECIPE_COUNT_ESTIMATE_THRESHOLD = 100000
+
+RECIPE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 6000 * 4000
+RECIPE_IMAGE_THUMBNAIL_SIZE = (320, 320)
+RECIPE_IMAGE_WEBP_SIZE = (1280, 1280)
+IMAGE_RENDER_WORKERS = 1
+
+AUTH_USER_CACHE_TTL = 5
+AUTH_USER_CACHE_SIZE = 1024
+
+THROTTLE_STORE = 'api.throttling.SQLiteSlidingWindowStore'
+THROTTLE_STORE_OPTIONS = {
+    'path': os.environ.get(
+        'THROTTLE_STORE_PATH',
+        default=os.path.join(tempfile.gettempdir(), 'foodgram-throttle.db')
+    ),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -122,11 +190,11 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachingJWTAuthentication',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'api.throttling.UserSlidingWindowThrottle',
+        'api.throttling.AnonSlidingWindowThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'user': '100000/day',
@@ -143,8 +211,6 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Token',),
 }
 
-os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
-
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'